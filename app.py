@@ -1,6 +1,4 @@
 import streamlit as st
-import os
-import tempfile # <--- ADD THIS LINE
 import models # Imports your models.py file
 
 # --- Page Configuration ---
@@ -18,8 +16,10 @@ if "summary" not in st.session_state:
     st.session_state.summary = ""
 if "explanation" not in st.session_state:
     st.session_state.explanation = ""
-if "audio_path" not in st.session_state:
-    st.session_state.audio_path = None
+if "audio_bytes" not in st.session_state:
+    st.session_state.audio_bytes = None
+if "audio_complete" not in st.session_state:
+    st.session_state.audio_complete = True
 if "feedback_history" not in st.session_state:
     st.session_state.feedback_history = []
 if "processing_done" not in st.session_state:
@@ -30,6 +30,20 @@ if "processing_done" not in st.session_state:
 st.title("📚 PDF Explainer AI")
 st.markdown("Upload your PDFs, choose a language, and get a simple summary, a detailed explanation, and an audio version!")
 
+# Shows the explanation while it is being generated; cleared once the results are ready
+live_output = st.empty()
+
+def audio_handler(placeholder):
+    """
+    Plays streamed audio in placeholder and keeps the complete MP3 in the session state.
+    """
+    def on_audio(audio_bytes, final, complete=True):
+        placeholder.audio(audio_bytes, format="audio/mp3")
+        if final:
+            st.session_state.audio_bytes = audio_bytes
+            st.session_state.audio_complete = complete
+    return on_audio
+
 # --- Sidebar for Controls ---
 with st.sidebar:
     st.header("⚙️ Controls")
@@ -57,17 +71,9 @@ with st.sidebar:
 
         with st.spinner("Processing documents... This might take a moment for large files or scanned pages."):
             # 1. Extract Text from all PDFs
-            all_texts = []
-            for uploaded_file in uploaded_files:
-                # To process, save the file temporarily
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(uploaded_file.getvalue())
-                    tmp_path = tmp.name
-                
-                text = models.extract_text_from_pdf(tmp_path)
-                if text:
-                    all_texts.append(text)
-                os.remove(tmp_path) # Clean up the temp file
+            # Each document is independent, so they are extracted in parallel
+            pdf_contents = [uploaded_file.getvalue() for uploaded_file in uploaded_files]
+            all_texts = [text for text in models.extract_texts_from_pdfs(pdf_contents) if text]
             
             if not all_texts:
                 st.error("Could not extract any text from the uploaded PDF(s). Please try a different file.")
@@ -78,18 +84,26 @@ with st.sidebar:
                 # Placeholder for fetching personalized keywords from a database
                 user_keywords = models.get_user_keywords_from_db(user_id="user123") # Example user_id
                 
-                st.session_state.summary = models.generate_summary(st.session_state.processed_text, selected_lang_name)
-                st.session_state.explanation = models.generate_explanation(
-                    st.session_state.processed_text, 
-                    selected_lang_name,
-                    user_keywords=user_keywords
-                )
-
-                # 3. Generate Audio
-                if "Error:" not in st.session_state.explanation:
-                    st.session_state.audio_path = models.text_to_speech(st.session_state.explanation, lang_code)
-                else:
-                    st.session_state.audio_path = None
+                # Summary and explanation are independent: the summary is generated in the background
+                # while the explanation streams onto the page and is turned into audio as it is written
+                llm_text = models.condense_text(st.session_state.processed_text)
+                # Resolve the cached model here on the script thread; the worker has no ScriptRunContext
+                model = models.get_model()
+                summary_future = models.BACKGROUND_EXECUTOR.submit(models.generate_summary, llm_text, selected_lang_name, model)
+                with live_output.container(border=True):
+                    st.subheader("Simple Explanation")
+                    audio_preview = st.empty()
+                    # 3. Generate Audio alongside the explanation
+                    st.session_state.audio_bytes = None
+                    st.session_state.explanation = st.write_stream(models.stream_explanation_with_speech(
+                        llm_text,
+                        selected_lang_name,
+                        lang_code,
+                        user_keywords=user_keywords,
+                        on_audio=audio_handler(audio_preview)
+                    ))
+                st.session_state.summary = summary_future.result()
+                live_output.empty()
                     
                 st.session_state.processing_done = True
         st.success("Processing complete!")
@@ -117,12 +131,13 @@ if st.session_state.processing_done:
             st.markdown(st.session_state.explanation)
 
             # --- Audio Player ---
-            if st.session_state.audio_path:
+            if st.session_state.audio_bytes:
                 st.subheader("🎧 Listen to the Explanation")
-                st.audio(st.session_state.audio_path, format="audio/mp3")
+                st.audio(st.session_state.audio_bytes, format="audio/mp3")
                 # Provide a download button for the audio
-                with open(st.session_state.audio_path, "rb") as f:
-                    st.download_button("Download Audio (MP3)", f, file_name="explanation.mp3")
+                st.download_button("Download Audio (MP3)", st.session_state.audio_bytes, file_name="explanation.mp3")
+                if not st.session_state.audio_complete:
+                    st.warning("Some parts of the explanation could not be converted to audio, so the recording skips them.")
             else:
                 st.warning("Could not generate audio for the explanation.")
 
@@ -145,18 +160,19 @@ if st.session_state.processing_done:
                     # Save feedback to DB (placeholder)
                     models.save_feedback_to_db("pdf123", st.session_state.explanation, feedback_prompt, [])
 
-                    # Regenerate explanation
-                    st.session_state.explanation = models.generate_explanation(
-                        st.session_state.processed_text,
-                        selected_lang_name,
-                        feedback_history=st.session_state.feedback_history
-                    )
-
-                    # Regenerate audio
-                    if "Error:" not in st.session_state.explanation:
-                        st.session_state.audio_path = models.text_to_speech(st.session_state.explanation, lang_code)
-                    else:
-                        st.session_state.audio_path = None
+                    # Regenerate explanation and audio together, playing audio as soon as the first sentences are ready
+                    feedback_output = st.empty()
+                    with feedback_output.container():
+                        audio_preview = st.empty()
+                        st.session_state.audio_bytes = None
+                        st.session_state.explanation = st.write_stream(models.stream_explanation_with_speech(
+                            st.session_state.processed_text,
+                            selected_lang_name,
+                            lang_code,
+                            feedback_history=st.session_state.feedback_history,
+                            on_audio=audio_handler(audio_preview)
+                        ))
+                    feedback_output.empty()
                 
                 st.success("Explanation updated!")
                 # A st.rerun() is implicitly called when a button is clicked, updating the UI.
@@ -1,11 +1,20 @@
 import fitz  # PyMuPDF
-import pytesseract
-from pdf2image import convert_from_path
+import streamlit as st
+from tesserocr import PyTessBaseAPI, PSM, OEM
+from PIL import Image
 from gtts import gTTS
-import tempfile
 import os
 import re
 import logging
+import queue
+import multiprocessing
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import math
+import diskcache
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -14,20 +23,26 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 load_dotenv()
 
 # --- API Configuration ---
-try:
-    API_KEY = os.getenv("GEMINI_API_KEY")
-    if not API_KEY:
-        raise ValueError("GEMINI_API_KEY not found in environment variables.")
-    genai.configure(api_key=API_KEY)
-    # Using a system instruction can prime the model for all subsequent requests
-    system_instruction = "You are an expert educator who explains complex topics in simple terms."
-    model = genai.GenerativeModel(
-        "models/gemini-1.5-flash-latest",
-        system_instruction=system_instruction
-    )
-except Exception as e:
-    logging.error(f"Failed to configure Gemini API: {e}")
-    model = None # Set model to None if configuration fails
+@st.cache_resource
+def get_model():
+    """
+    Configures Gemini and builds the model once, sharing it across reruns and sessions.
+    Returns None if configuration fails.
+    """
+    try:
+        API_KEY = os.getenv("GEMINI_API_KEY")
+        if not API_KEY:
+            raise ValueError("GEMINI_API_KEY not found in environment variables.")
+        genai.configure(api_key=API_KEY)
+        # Using a system instruction can prime the model for all subsequent requests
+        system_instruction = "You are an expert educator who explains complex topics in simple terms."
+        return genai.GenerativeModel(
+            "models/gemini-1.5-flash-latest",
+            system_instruction=system_instruction
+        )
+    except Exception as e:
+        logging.error(f"Failed to configure Gemini API: {e}")
+        return None # Return None if configuration fails
 
 # --- Constants ---
 LANGUAGES = {
@@ -35,6 +50,51 @@ LANGUAGES = {
     "Tamil": "ta", "Telugu": "te", "Kannada": "kn", "Bengali": "bn",
     "Malayalam": "ml", "Punjabi": "pa", "Urdu": "ur"
 }
+# Number of warm Tesseract handles; each page is recognized on one of them in parallel.
+# Tesseract already uses ~4 threads per page, so a quarter of the cores is enough
+OCR_CONCURRENCY = max(1, int(os.getenv("OCR_CONCURRENCY", max(1, (os.cpu_count() or 1) // 4))))
+# Render resolution for OCR pages; Tesseract cost grows with pixel count.
+# Scans render at their own resolution, capped at MAX_OCR_DPI
+DEFAULT_OCR_DPI = 200
+MIN_OCR_DPI = 72
+MAX_OCR_DPI = 200
+
+# Extraction workers; each runs one Tesseract handle, which already uses ~4 OpenMP threads
+EXTRACTION_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+# Extracted PDF text is kept for a day, keyed on the file content
+EXTRACTION_CACHE_TTL = 24 * 3600
+# Set only inside extraction worker processes, which have no Streamlit runtime
+_worker_ocr_pool = None
+
+# Bump this whenever a prompt template changes so older cached responses are ignored
+PROMPT_VERSION = "1"
+# Gemini responses and extracted PDF text share one on-disk cache
+_disk_cache = diskcache.Cache("./.gemini_cache")
+
+# Precompiled patterns for text cleaning
+# One pass: runs of spaces/tabs become a single space, runs of blank lines a single newline
+_CLEAN_RE = re.compile(r'([ \t]+)|((?:\n\s*)+\n)')
+# Markdown characters are simply deleted, which str.translate does faster than a regex
+_MD_DROP = str.maketrans('', '', '*#_`~')
+
+# Sentence splitting for streaming speech synthesis; besides ASCII punctuation this covers the
+# danda used by Hindi, Marathi, Bengali and Punjabi, and the Urdu full stop and question mark
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?\u0964\u0965\u06d4\u061f])\s+')
+_ABBREVIATIONS = ("Mr.", "Mrs.", "Ms.", "Dr.", "Prof.", "Sr.", "Jr.", "St.", "vs.", "e.g.", "i.e.", "etc.")
+MIN_SENTENCE_CHARS = 10
+TTS_CONCURRENCY = 4
+TTS_CHUNK_CHARS = 500
+TTS_ATTEMPTS = 3
+# Roughly a minute of speech before the preview player appears
+PREVIEW_MIN_CHARS = 1000
+
+# Long documents are summarized chunk by chunk before prompting (~4 characters per token)
+MAX_PROMPT_CHARS = 30000
+CHUNK_OVERLAP_CHARS = 2000
+CONDENSE_CONCURRENCY = 4
+
+# Shared pool for blocking calls that run alongside the Streamlit script thread
+BACKGROUND_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
 
 # === DATABASE PLACEHOLDER FUNCTIONS ===
 # In a real app, these would interact with your database (e.g., SQLite, PostgreSQL)
@@ -50,80 +110,253 @@ def get_user_keywords_from_db(user_id):
     return [] # Return empty list for now
 
 # --- Core Functions ---
-def extract_text_from_pdf(pdf_path):
+def _pdf_cache_key(pdf_bytes):
+    # Keyed on the file content, so a re-upload under another name is still a hit
+    return "pdf:" + hashlib.sha256(pdf_bytes).hexdigest()
+
+def extract_text_from_pdf(pdf_bytes):
     """
-    Extracts text from a PDF, using OCR for image-based pages more efficiently.
+    Extracts text from the raw bytes of a PDF. Results are cached on the file content,
+    so uploading the same document again skips extraction and OCR.
     """
-    logging.info(f"Extracting text from: {pdf_path}")
-    extracted_text = ""
-    image_pages = []
-    try:
-        doc = fitz.open(pdf_path)
-        for page_num, page in enumerate(doc):
-            # First, try to get text directly
-            text = page.get_text().strip()
-            if text:
-                extracted_text += text + "\n"
+    key = _pdf_cache_key(pdf_bytes)
+    text = _cache_get(key)
+    if text is None:
+        text = _extract_text_from_bytes(pdf_bytes)
+        _cache_set(key, text, expire=EXTRACTION_CACHE_TTL)
+    return text
+
+def extract_texts_from_pdfs(pdf_bytes_list):
+    """
+    Extracts text from several PDFs, returning texts in input order. Cached documents are reused
+    and text-only ones are read in-process; only documents that need OCR go to the worker
+    processes, falling back to threads where child processes cannot be started.
+    """
+    texts = [None] * len(pdf_bytes_list)
+    ocr_jobs = []
+    for i, pdf_bytes in enumerate(pdf_bytes_list):
+        texts[i] = _cache_get(_pdf_cache_key(pdf_bytes))
+        if texts[i] is None:
+            if _needs_ocr(pdf_bytes):
+                ocr_jobs.append(i)
             else:
-                # If no text, mark page for OCR
-                image_pages.append(page_num + 1)
-        
-        # Process all image-based pages in one go for efficiency
-        if image_pages:
-            logging.info(f"Performing OCR on pages: {image_pages}")
-            try:
-                images = convert_from_path(pdf_path, first_page=min(image_pages), last_page=max(image_pages))
-                # Create a map of page number to image object
-                page_to_image_map = {p_num: img for p_num, img in zip(range(min(image_pages), max(image_pages) + 1), images)}
+                texts[i] = extract_text_from_pdf(pdf_bytes)
+    if len(ocr_jobs) <= 1:
+        for i in ocr_jobs:
+            texts[i] = extract_text_from_pdf(pdf_bytes_list[i])
+        return texts
 
-                for page_num in image_pages:
-                     if page_num in page_to_image_map:
-                        extracted_text += pytesseract.image_to_string(page_to_image_map[page_num]) + "\n"
-            except Exception as ocr_error:
-                logging.error(f"OCR processing failed for {pdf_path}: {ocr_error}")
+    ocr_bytes = [pdf_bytes_list[i] for i in ocr_jobs]
+    try:
+        results = list(get_extraction_process_pool().map(_extract_text_from_bytes, ocr_bytes))
+    except (OSError, NotImplementedError, BrokenProcessPool) as e:
+        logging.warning(f"Process pool unavailable, extracting PDFs with threads instead: {e}")
+        # Drop a broken pool so the next request starts a fresh one
+        get_extraction_process_pool.clear()
+        with ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS) as executor:
+            results = list(executor.map(_extract_text_from_bytes, ocr_bytes))
+    for i, pdf_bytes, text in zip(ocr_jobs, ocr_bytes, results):
+        texts[i] = text
+        _cache_set(_pdf_cache_key(pdf_bytes), text, expire=EXTRACTION_CACHE_TTL)
+    return texts
+
+def _needs_ocr(pdf_bytes):
+    # Any page without a text layer means OCR; unreadable files are left to the in-process path
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return any(not page.get_text().strip() for page in doc)
+    except Exception:
+        return False
 
+@st.cache_resource
+def get_extraction_process_pool():
+    """
+    Starts the OCR worker processes once and keeps them for the life of the server,
+    so each request pays only for the work it sends rather than for process startup.
+    """
+    # Parsing and OCR are CPU-bound, so separate processes sidestep the GIL.
+    # "spawn" avoids forking the Streamlit server with its threads and OpenMP state.
+    return ProcessPoolExecutor(
+        max_workers=EXTRACTION_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_extraction_worker
+    )
+
+def _init_extraction_worker():
+    # One Tesseract handle per worker process: each already runs ~4 OpenMP threads,
+    # and the workers themselves provide the parallelism. The handle is created here
+    # directly, since st.cache_resource has no Streamlit runtime in a child process.
+    global OCR_CONCURRENCY, _worker_ocr_pool
+    OCR_CONCURRENCY = 1
+    _worker_ocr_pool = queue.Queue()
+    _worker_ocr_pool.put(_new_ocr_api())
+
+def _extract_text_from_bytes(pdf_bytes):
+    """
+    Extracts text from a PDF held in memory, using OCR for image-based pages more efficiently.
+    Module-level so it can be pickled into worker processes.
+    """
+    pdf_id = hashlib.md5(pdf_bytes).hexdigest()[:8]
+    logging.info(f"Extracting text from PDF {pdf_id} ({len(pdf_bytes)} bytes)")
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        # Clean page by page and join once, instead of growing one string with +=
+        pages = [clean_text(page_text) for page_text in extract_page_texts(doc, pdf_id)]
+        extracted_text = "\n".join(page_text for page_text in pages if page_text)
         doc.close()
-        logging.info(f"Text extraction complete for {pdf_path}.")
-        return clean_text(extracted_text)
+        logging.info(f"Text extraction complete for PDF {pdf_id}.")
+        return extracted_text
     except Exception as e:
-        logging.error(f"Failed to open or process PDF {pdf_path}: {e}")
+        logging.error(f"Failed to open or process PDF {pdf_id}: {e}")
         return "" # Return empty string on failure
 
+def extract_page_texts(doc, pdf_id=""):
+    """
+    Returns the text of each page in page order, using OCR for pages without a text layer.
+    """
+    page_texts = []
+    image_pages = []
+    for page_num, page in enumerate(doc):
+        # First, try to get text directly
+        text = page.get_text().strip()
+        page_texts.append(text)
+        if not text:
+            # If no text, mark page for OCR
+            image_pages.append(page_num)
+
+    # Process all image-based pages in one go for efficiency
+    if image_pages:
+        logging.info(f"Performing OCR on pages: {[p_num + 1 for p_num in image_pages]}")
+        try:
+            # Render with the already-open document instead of re-parsing it in a poppler subprocess
+            ocr_images = [render_page_image(doc[p_num], estimate_ocr_dpi(doc[p_num])) for p_num in image_pages]
+            for p_num, page_text in zip(image_pages, ocr_images_to_text(ocr_images)):
+                page_texts[p_num] = page_text
+        except Exception as ocr_error:
+            logging.error(f"OCR processing failed for PDF {pdf_id}: {ocr_error}")
+
+    return page_texts
+
+def estimate_ocr_dpi(page):
+    """
+    Picks the render DPI for OCR from the resolution of the page's main scanned image,
+    capped at MAX_OCR_DPI. Rendering above the scan's own resolution adds pixels but no detail.
+    Pages without embedded images, or that can't be inspected, use DEFAULT_OCR_DPI.
+    """
+    try:
+        # The largest placed image is the page scan; small logos or stamps don't count
+        largest_area, native_dpi = 0, None
+        for image in page.get_images(full=True):
+            xref, width_px = image[0], image[2]
+            for rect in page.get_image_rects(xref):
+                area = rect.width * rect.height
+                if rect.width > 0 and area > largest_area:
+                    largest_area, native_dpi = area, width_px / (rect.width / 72)
+        if native_dpi:
+            return int(max(MIN_OCR_DPI, min(native_dpi, MAX_OCR_DPI)))
+    except Exception as e:
+        logging.warning(f"Could not inspect page {page.number + 1} images, using default DPI: {e}")
+    return DEFAULT_OCR_DPI
+
+def render_page_image(page, dpi=DEFAULT_OCR_DPI):
+    """
+    Rasterizes a PyMuPDF page into a PIL image for OCR.
+    """
+    pix = page.get_pixmap(dpi=dpi)
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+@st.cache_resource
+def get_ocr_api_pool():
+    """
+    Loads OCR_CONCURRENCY Tesseract engines once and shares them across reruns and sessions.
+    A handle is not reentrant, so each one is checked out of the queue for exclusive use.
+    """
+    logging.info(f"Initializing {OCR_CONCURRENCY} Tesseract OCR engine(s).")
+    pool = queue.Queue()
+    for _ in range(OCR_CONCURRENCY):
+        pool.put(_new_ocr_api())
+    return pool
+
+def _new_ocr_api():
+    # Handles are never End()-ed, so the LSTM model stays loaded between pages and requests
+    return PyTessBaseAPI(lang="eng", psm=PSM.AUTO, oem=OEM.LSTM_ONLY)
+
+def _ocr_image(image):
+    pool = _worker_ocr_pool if _worker_ocr_pool is not None else get_ocr_api_pool()
+    api = pool.get()
+    try:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    finally:
+        pool.put(api)
+
+def ocr_images_to_text(images):
+    """
+    Runs OCR on a list of page images and returns one text string per image, in order.
+    """
+    if len(images) <= 1 or OCR_CONCURRENCY == 1:
+        return [_ocr_image(image) for image in images]
+    # tesserocr releases the GIL while recognizing, so threads keep every handle busy
+    with ThreadPoolExecutor(max_workers=OCR_CONCURRENCY) as executor:
+        return list(executor.map(_ocr_image, images))
+
 def clean_text(text):
     """
     Cleans extracted text by removing unwanted characters and normalizing whitespace.
     """
-    logging.info("Cleaning extracted text.")
     # Remove special characters but keep essential punctuation and multilingual characters
-    text = re.sub(r'(\n\s*)+\n', '\n', text) # Replace multiple newlines with a single one
-    text = re.sub(r'[ \t]+', ' ', text)      # Replace multiple spaces/tabs with a single space
+    # Replace multiple spaces/tabs with a single space and multiple newlines with a single one
+    text = _CLEAN_RE.sub(lambda m: ' ' if m.group(1) else '\n', text)
     return text.strip()
 
-def generate_summary(text, language):
+def _cache_key(prompt):
+    # The prompt already carries the text, language, feedback and keywords
+    return hashlib.sha256(f"{PROMPT_VERSION}|{prompt}".encode("utf-8")).hexdigest()
+
+def _cache_get(key):
+    try:
+        return _disk_cache.get(key)
+    except Exception as e:
+        logging.warning(f"Disk cache read failed: {e}")
+        return None
+
+def _cache_set(key, value, expire=None):
+    # An empty response would otherwise be served forever as a cache hit
+    if not value or not value.strip():
+        return
+    try:
+        _disk_cache.set(key, value, expire=expire)
+    except Exception as e:
+        logging.warning(f"Disk cache write failed: {e}")
+
+def _cached_generate(prompt, call):
     """
-    Generates a concise summary of the text in the specified language.
+    Returns the cached response for prompt, or calls call(prompt) and caches its text.
+    Exceptions from call propagate to the caller.
     """
-    if not model: return "Error: Gemini model is not configured. Please check API key."
-    logging.info(f"Generating summary in {language}.")
-    prompt = (
+    key = _cache_key(prompt)
+    cached = _cache_get(key)
+    if cached is not None:
+        logging.info("Using cached Gemini response.")
+        return cached
+    text = call(prompt)
+    _cache_set(key, text)
+    return text
+
+def build_summary_prompt(text, language):
+    """
+    Builds the Gemini prompt for a short summary.
+    """
+    return (
         f"You are a helpful assistant. Summarize the following document in a few simple sentences in {language}. "
         "Focus only on the core message. The goal is a very quick overview.\n\n"
         f"DOCUMENT:\n---\n{text}"
     )
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        logging.error(f"Gemini API call for summary failed: {e}")
-        return f"Error: Could not generate summary. ({e})"
 
-def generate_explanation(text, language, feedback_history=None, user_keywords=None):
+def build_explanation_prompt(text, language, feedback_history=None, user_keywords=None):
     """
-    Generates a simple, beginner-friendly explanation with real-life examples.
+    Builds the Gemini prompt for a beginner-friendly explanation.
     """
-    if not model: return "Error: Gemini model is not configured. Please check API key."
-    logging.info(f"Generating explanation in {language}.")
-    
     prompt_parts = [
         f"Explain the following document in {language} for a complete beginner. Use simple words, short sentences, and a friendly tone. "
         "Crucially, provide a relatable, real-life example or analogy to make the main concept understandable.",
@@ -139,28 +372,228 @@ def generate_explanation(text, language, feedback_history=None, user_keywords=No
         keywords_str = ", ".join(user_keywords)
         prompt_parts.append(f"\nUSER PREFERENCES: The user is particularly interested in these topics: {keywords_str}. Please emphasize them if relevant.")
 
-    prompt = "\n".join(prompt_parts)
+    return "\n".join(prompt_parts)
 
-    try:
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        logging.error(f"Gemini API call for explanation failed: {e}")
-        return f"Error: Could not generate explanation. ({e})"
+def build_chunk_summary_prompt(chunk):
+    """
+    Builds the Gemini prompt that condenses one part of a long document.
+    """
+    return (
+        "The following text is one part of a longer document. Summarize it in English, keeping the key ideas, "
+        "definitions, facts and examples so the whole document can be explained from the combined summaries.\n\n"
+        f"DOCUMENT PART:\n---\n{chunk}"
+    )
+
+def _summarize_chunk(model, chunk):
+    return _cached_generate(build_chunk_summary_prompt(chunk), lambda prompt: model.generate_content(prompt).text)
+
+def _split_windows(text):
+    """
+    Splits text into the fewest windows of at most MAX_PROMPT_CHARS that overlap by CHUNK_OVERLAP_CHARS,
+    spreading them evenly so no window is mostly overlap.
+    """
+    step = MAX_PROMPT_CHARS - CHUNK_OVERLAP_CHARS
+    count = max(1, math.ceil((len(text) - CHUNK_OVERLAP_CHARS) / step))
+    size = math.ceil((len(text) + (count - 1) * CHUNK_OVERLAP_CHARS) / count)
+    stride = size - CHUNK_OVERLAP_CHARS
+    return [text[i * stride:i * stride + size] for i in range(count)]
+
+def condense_text(text):
+    """
+    Map-reduce step for long documents: splits text over MAX_PROMPT_CHARS into overlapping chunks,
+    summarizes them concurrently and returns the joined summaries. Short text is returned unchanged.
+    """
+    if len(text) <= MAX_PROMPT_CHARS:
+        return text
+    model = get_model()
+    if not model: return text
+    while len(text) > MAX_PROMPT_CHARS:
+        chunks = _split_windows(text)
+        logging.info(f"Condensing long document ({len(text)} chars) in {len(chunks)} chunks.")
+        # Plain blocking calls on a bounded pool: no event loop is tied to the shared model,
+        # and at most CONDENSE_CONCURRENCY requests are in flight
+        with ThreadPoolExecutor(max_workers=CONDENSE_CONCURRENCY) as executor:
+            futures = [executor.submit(_summarize_chunk, model, chunk) for chunk in chunks]
+            summaries = []
+            for chunk_num, future in enumerate(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    # Keep the other summaries; one failed chunk (e.g. a rate limit) shouldn't discard them
+                    logging.error(f"Gemini API call for chunk {chunk_num + 1}/{len(chunks)} summary failed: {e}")
+        if not summaries:
+            logging.error("All chunk summaries failed, truncating document.")
+            return text[:MAX_PROMPT_CHARS]
+        condensed = "\n\n".join(summaries)
+        if len(condensed) >= len(text):
+            return condensed[:MAX_PROMPT_CHARS]
+        text = condensed
+    return text
 
-def text_to_speech(text, lang_code="en"):
+def generate_summary(text, language, model=None):
     """
-    Converts text to an MP3 audio file using gTTS.
+    Generates a concise summary of the text in the specified language.
+    Pass model when calling from a worker thread, so the cached model is resolved on the script thread.
     """
-    logging.info(f"Converting text to speech in language: {lang_code}")
-    # Remove markdown for cleaner speech
-    clean_audio_text = re.sub(r"[\*#_`~]+", "", text)
+    model = model or get_model()
+    if not model: return "Error: Gemini model is not configured. Please check API key."
+    logging.info(f"Generating summary in {language}.")
+    text = condense_text(text)
+    prompt = build_summary_prompt(text, language)
     try:
-        tts = gTTS(text=clean_audio_text, lang=lang_code, slow=False)
-        # Use a temporary file to store the audio
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-            tts.save(fp.name)
-            return fp.name
+        return _cached_generate(prompt, lambda prompt: model.generate_content(prompt).text)
     except Exception as e:
-        logging.error(f"gTTS failed: {e}")
-        return None
\ No newline at end of file
+        logging.error(f"Gemini API call for summary failed: {e}")
+        return f"Error: Could not generate summary. ({e})"
+
+def _split_sentences(buffer):
+    """
+    Splits buffered text into complete sentences and the unfinished remainder.
+    """
+    pieces = _SENTENCE_END_RE.split(buffer)
+    remainder = pieces.pop()
+    sentences = []
+    current = ""
+    for piece in pieces:
+        current = f"{current} {piece}" if current else piece
+        # Don't break after abbreviations like "Dr." and keep very short fragments with the next one
+        if current.endswith(_ABBREVIATIONS) or len(current) < MIN_SENTENCE_CHARS:
+            continue
+        sentences.append(current)
+        current = ""
+    if current:
+        remainder = f"{current} {remainder}"
+    return sentences, remainder
+
+def _chunk_text(text, max_chars=TTS_CHUNK_CHARS):
+    """
+    Groups sentences into chunks of at most max_chars characters for separate gTTS requests.
+    A single sentence longer than max_chars becomes its own chunk.
+    """
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _synthesize_mp3(text, lang_code):
+    """
+    Synthesizes a single piece of text with gTTS and returns the raw MP3 bytes.
+    Transient failures (rate limits, network errors) are retried with a short backoff.
+    """
+    for attempt in range(1, TTS_ATTEMPTS + 1):
+        try:
+            buffer = io.BytesIO()
+            gTTS(text=text, lang=lang_code, slow=False).write_to_fp(buffer)
+            return buffer.getvalue()
+        except Exception as e:
+            if attempt == TTS_ATTEMPTS:
+                raise
+            logging.warning(f"gTTS attempt {attempt}/{TTS_ATTEMPTS} failed, retrying: {e}")
+            time.sleep(attempt)
+
+def stream_explanation_with_speech(text, language, lang_code="en", feedback_history=None, user_keywords=None, on_audio=None):
+    """
+    Yields the explanation piece by piece as Gemini streams it (e.g. for st.write_stream), while
+    synthesizing speech in the background as complete sentences arrive. on_audio(audio_bytes, final, complete=True)
+    is called at most twice: with a preview once about PREVIEW_MIN_CHARS of text has been synthesized
+    (only if more audio is still pending), then with the full MP3 and final=True;
+    complete is False if some chunks could not be synthesized and are missing from the audio.
+    """
+    model = get_model()
+    if not model:
+        yield "Error: Gemini model is not configured. Please check API key."
+        return
+    logging.info(f"Generating explanation with speech in {language}.")
+    text = condense_text(text)
+    prompt = build_explanation_prompt(text, language, feedback_history, user_keywords)
+    key = _cache_key(prompt)
+    cached = _cache_get(key)
+
+    futures = []
+    future_chars = []
+    preview_published = False
+
+    def submit(sentence):
+        clean_sentence = sentence.translate(_MD_DROP).strip()
+        # gTTS rejects fragments with nothing to speak, such as a trailing "..."
+        if any(char.isalnum() for char in clean_sentence):
+            futures.append(executor.submit(_synthesize_mp3, clean_sentence, lang_code))
+            future_chars.append(len(clean_sentence))
+
+    def publish_preview():
+        # Hand over the finished prefix of the audio once it covers PREVIEW_MIN_CHARS of text, so there
+        # is something worth listening to while the rest is synthesized; replacing the player again would
+        # restart it. MP3 frames can simply be concatenated
+        nonlocal preview_published
+        if not on_audio or preview_published:
+            return
+        ready = []
+        ready_chars = 0
+        for future, chars in zip(futures, future_chars):
+            if not future.done() or future.exception() is not None:
+                break
+            ready.append(future.result())
+            ready_chars += chars
+        if ready_chars >= PREVIEW_MIN_CHARS:
+            preview_published = True
+            on_audio(b"".join(ready), False)
+
+    with ThreadPoolExecutor(max_workers=TTS_CONCURRENCY) as executor:
+        if cached is not None:
+            logging.info("Using cached explanation.")
+            for chunk in _chunk_text(cached):
+                submit(chunk)
+            yield cached
+        else:
+            explanation = ""
+            buffer = ""
+            # The first sentence goes to gTTS alone for fast first audio; later ones are grouped
+            # into chunks of up to TTS_CHUNK_CHARS to keep the number of requests down
+            pending = ""
+            try:
+                for chunk in model.generate_content(prompt, stream=True):
+                    explanation += chunk.text
+                    buffer += chunk.text
+                    sentences, buffer = _split_sentences(buffer)
+                    for sentence in sentences:
+                        if not futures:
+                            submit(sentence)
+                        elif pending and len(pending) + 1 + len(sentence) > TTS_CHUNK_CHARS:
+                            submit(pending)
+                            pending = sentence
+                        else:
+                            pending = f"{pending} {sentence}" if pending else sentence
+                    publish_preview()
+                    yield chunk.text
+            except Exception as e:
+                logging.error(f"Gemini API call for explanation failed: {e}")
+                for future in futures:
+                    future.cancel()
+                yield f"\n\nError: Could not generate explanation. ({e})"
+                return
+            for tail_chunk in _chunk_text(f"{pending} {buffer}"):
+                submit(tail_chunk)
+            _cache_set(key, explanation)
+
+        audio_chunks = []
+        failed_chunks = 0
+        for chunk_num, future in enumerate(futures):
+            if not future.done():
+                publish_preview()
+            try:
+                audio_chunks.append(future.result())
+            except Exception as e:
+                # Keep the rest of the audio, but report that it no longer covers the whole text
+                failed_chunks += 1
+                logging.error(f"gTTS failed for speech chunk {chunk_num + 1}/{len(futures)} after {TTS_ATTEMPTS} attempts: {e}")
+        audio = b"".join(audio_chunks)
+
+    if audio and on_audio:
+        on_audio(audio, True, failed_chunks == 0)